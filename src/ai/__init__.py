@@ -0,0 +1,4 @@
+"""
+AI分析模块包
+包含调用大模型分析股票数据的所有功能
+"""
\ No newline at end of file
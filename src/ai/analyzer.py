@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Any
+
+import tiktoken
+from openai import OpenAI
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import load_companies, find_file, load_csv_data, read_markdown_file, count_tokens
+
+# 确保log目录存在 (修改为与src同级目录)
+log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'log')
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# 为analyzer模块创建独立的日志配置
+logger = logging.getLogger('ai.analyzer')
+
+# 只有在logger没有处理器时才添加处理器，避免重复
+if not logger.handlers:
+    logger.setLevel(logging.INFO)
+
+    # 创建文件处理器
+    file_handler = logging.FileHandler(os.path.join(log_dir, 'analyzer.log'), encoding='utf-8')
+    file_handler.setLevel(logging.INFO)
+
+    # 创建日志格式
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+
+    # 添加处理器到logger
+    logger.addHandler(file_handler)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_PROMPT_TEMPLATE = """You are a quantitative trading analyst.
+Below are the recent daily bars for {company} as a JSON array with the fields
+date, open, high, low, close, volume, average and barCount.
+
+{data}
+
+Summarize the trend, support and resistance levels and volatility, then propose a concrete
+trading strategy for {company} with entry, exit and stop-loss rules.
+"""
+
+
+class ResponseCache:
+    """On-disk cache of model responses keyed by a hash of the model, prompt template, company and bars"""
+
+    def __init__(self, cache_dir: str = os.path.join(PROJECT_DIR, 'cache', 'llm')):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, template: str, company: str, data: str) -> str:
+        """Hash everything that influences the response"""
+        digest = hashlib.sha256()
+        for part in (model, template, company, data):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class RateLimiter:
+    """Space out requests so at most `requests_per_minute` start in any minute"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class TokenBudget:
+    """Shared token allowance for one run; requests reserve their worst case up front"""
+
+    def __init__(self, total_tokens: Optional[int]):
+        self.remaining = total_tokens
+        self._in_flight = 0
+        self._settled = threading.Condition()
+
+    def reserve(self, tokens: int) -> bool:
+        """Reserve tokens, waiting while in-flight requests may still return unused tokens.
+
+        Returns False only when nothing is in flight and the budget cannot cover the request.
+        """
+        with self._settled:
+            if self.remaining is None:
+                return True
+            while tokens > self.remaining:
+                if not self._in_flight:
+                    return False
+                self._settled.wait()
+            self.remaining -= tokens
+            self._in_flight += 1
+            return True
+
+    def settle(self, reserved: int, used: int):
+        """Return the unused part of a reservation"""
+        with self._settled:
+            if self.remaining is not None:
+                self.remaining += reserved - used
+                self._in_flight -= 1
+                self._settled.notify_all()
+
+
+class StrategyAnalyzer:
+    """Run the AI strategy analysis for many companies concurrently"""
+
+    def __init__(
+        self,
+        model: str = os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+        template: str = DEFAULT_PROMPT_TEMPLATE,
+        max_workers: int = 4,
+        requests_per_minute: float = 60,
+        token_budget: Optional[int] = None,
+        max_tokens: int = 1024,
+        cache: Optional[ResponseCache] = None,
+        client: Optional[OpenAI] = None
+    ):
+        self.model = model
+        self.template = template
+        self.max_workers = max_workers
+        self.max_tokens = max_tokens
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.budget = TokenBudget(token_budget)
+        self.cache = cache or ResponseCache()
+        # OPENAI_BASE_URL points the client at a compatible or local mock completion server
+        self.client = client or OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY', 'not-set'),
+            base_url=os.getenv('OPENAI_BASE_URL') or None
+        )
+        try:
+            try:
+                encoding_name = tiktoken.encoding_name_for_model(model)
+            except KeyError:
+                encoding_name = 'cl100k_base'
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            # tiktoken downloads its encodings on first use, which fails on offline hosts
+            logger.warning(f"Cannot load tiktoken encoding for {model}, estimating tokens from length: {e}")
+            self.encoding = None
+
+    def count_prompt_tokens(self, prompt: str) -> int:
+        """Count prompt tokens, roughly 4 characters per token without an encoding"""
+        if self.encoding is None:
+            return len(prompt) // 4 + 1
+        return count_tokens(prompt, self.encoding)
+
+    def build_prompt(self, company: str, data: str) -> str:
+        """Fill the template; str.replace keeps literal braces in markdown templates intact"""
+        return self.template.replace('{company}', company).replace('{data}', data)
+
+    def analyze(self, company: str, data: str) -> Dict[str, Any]:
+        """Analyze one company's bars, answering from the cache when the input is unchanged"""
+        key = ResponseCache.make_key(self.model, self.template, company, data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Using cached analysis for {company}")
+            return {**cached, 'company': company, 'cached': True}
+
+        prompt = self.build_prompt(company, data)
+        reserved = self.count_prompt_tokens(prompt) + self.max_tokens
+        if not self.budget.reserve(reserved):
+            logger.warning(f"Token budget exhausted, skipping {company} ({reserved} tokens needed)")
+            return {'company': company, 'status': 'skipped', 'reason': 'token budget exhausted'}
+
+        used = 0
+        try:
+            self.rate_limiter.wait()
+            logger.info(f"Requesting analysis for {company}...")
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{'role': 'user', 'content': prompt}],
+                max_tokens=self.max_tokens
+            )
+            used = response.usage.total_tokens if response.usage else reserved
+        except Exception:
+            used = reserved
+            raise
+        finally:
+            self.budget.settle(reserved, used)
+
+        result = {
+            'status': 'success',
+            'model': self.model,
+            'content': response.choices[0].message.content,
+            'total_tokens': used
+        }
+        self.cache.put(key, result)
+        return {**result, 'company': company, 'cached': False}
+
+    def run(self, inputs: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Analyze every company in `inputs` (company -> bars JSON) concurrently"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.analyze, company, data): company for company, data in inputs.items()}
+            for future in as_completed(futures):
+                company = futures[future]
+                try:
+                    results[company] = future.result()
+                except Exception as e:
+                    logger.error(f"Error analyzing {company}: {e}")
+                    results[company] = {'company': company, 'status': 'error', 'reason': str(e)}
+        return results
+
+
+def load_inputs(companies: List[str], data_dir: str, duration: str, bar_size: str) -> Dict[str, str]:
+    """Load the CSV bars saved by IBServer.save_data for each company"""
+    inputs = {}
+    for company in companies:
+        csv_path = find_file(directory=data_dir, duration=duration, bar_size=bar_size, company=company)
+        if not csv_path:
+            continue
+        data = load_csv_data(csv_path)
+        if data:
+            inputs[company] = data
+    return inputs
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments for the analysis runner"""
+    parser = argparse.ArgumentParser(description='AI Analyze - Generate trading strategies for all configured companies')
+    parser.add_argument('--duration', type=str, default="4",
+                        help='Duration value of the saved data (default: 4) month')
+    parser.add_argument('--bar-size', type=str, default="1",
+                        help='Bar size value of the saved data (default: 1) day')
+    parser.add_argument('--prompt', type=str, default=None,
+                        help='Markdown prompt template with {company} and {data} placeholders')
+    parser.add_argument('--model', type=str, default=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+                        help='Model name (default: $OPENAI_MODEL or gpt-4o-mini)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Concurrent requests (default: 4)')
+    parser.add_argument('--rpm', type=float, default=60,
+                        help='Maximum requests per minute (default: 60)')
+    parser.add_argument('--token-budget', type=int, default=None,
+                        help='Maximum total tokens for this run (default: unlimited)')
+    parser.add_argument('--output-dir', type=str, default=os.path.join(PROJECT_DIR, 'analysis'),
+                        help='Directory for the generated strategies')
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    """Run the AI strategy analysis over companies.json"""
+    if args is None:
+        args = parse_args()
+
+    template = DEFAULT_PROMPT_TEMPLATE
+    if args.prompt:
+        template = read_markdown_file(args.prompt)
+        if template is None:
+            logger.error(f"Prompt template not found: {args.prompt}")
+            sys.exit(1)
+
+    companies = load_companies()
+    data_dir = os.path.join(os.getcwd(), "data")
+    inputs = load_inputs(companies, data_dir, f"{args.duration}M", f"{args.bar_size}day")
+    logger.info(f"Loaded data for {len(inputs)}/{len(companies)} companies")
+
+    analyzer = StrategyAnalyzer(
+        model=args.model,
+        template=template,
+        max_workers=args.workers,
+        requests_per_minute=args.rpm,
+        token_budget=args.token_budget
+    )
+    results = analyzer.run(inputs)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for company, result in results.items():
+        if result.get('status') == 'success':
+            with open(os.path.join(args.output_dir, f"{company}.md"), 'w', encoding='utf-8') as f:
+                f.write(result['content'] or '')
+        logger.info(f"{company}: {result.get('status')}{' (cached)' if result.get('cached') else ''}")
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from db.database import StockDatabase
+
+# 为analytics模块创建独立的日志配置
+logger = logging.getLogger('db.analytics')
+
+TRADING_DAYS = 252
+DEFAULT_BENCHMARKS = ('SPY', 'QQQ')
+DEFAULT_LOOKBACK = 252
+DEFAULT_WINDOW = 20
+MIN_PERIODS = 2
+
+# Results keyed by (data version, companies, benchmarks, lookback, window)
+_CACHE_SIZE = 64
+_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def build_close_panel(rows: List[tuple]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """Pivot (company, date, close) rows into a dates x symbols close-price matrix (NaN where missing)"""
+    if not rows:
+        return np.array([], dtype='datetime64[D]'), [], np.empty((0, 0))
+
+    companies, dates, closes = zip(*rows)
+    companies = np.array(companies)
+    dates = np.array(dates, dtype='datetime64[D]')
+    closes = np.array([np.nan if c is None else float(c) for c in closes])
+
+    unique_dates, date_idx = np.unique(dates, return_inverse=True)
+    symbols, symbol_idx = np.unique(companies, return_inverse=True)
+
+    panel = np.full((len(unique_dates), len(symbols)), np.nan)
+    panel[date_idx, symbol_idx] = closes
+    return unique_dates, symbols.tolist(), panel
+
+
+def compute_returns(panel: np.ndarray) -> np.ndarray:
+    """Simple daily returns; NaN where either day is missing"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return panel[1:] / panel[:-1] - 1.0
+
+
+def rolling_volatility(returns: np.ndarray, window: int) -> np.ndarray:
+    """Annualized rolling standard deviation of returns, one row per complete window"""
+    if returns.shape[0] < window:
+        return np.empty((0, returns.shape[1]))
+
+    # (T - window + 1, N, window) view, no copy
+    windows = sliding_window_view(returns, window, axis=0)
+    valid = ~np.isnan(windows)
+    count = valid.sum(axis=-1)
+    filled = np.where(valid, windows, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = filled.sum(axis=-1) / count
+        sq_dev = np.where(valid, windows - mean[..., None], 0.0) ** 2
+        variance = sq_dev.sum(axis=-1) / (count - 1)
+    variance[count < max(MIN_PERIODS, window // 2)] = np.nan
+    return np.sqrt(variance) * np.sqrt(TRADING_DAYS)
+
+
+def _pairwise_moments(returns: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pairwise-complete observation counts, co-moments and variances for all column pairs.
+
+    var[i, j] is the (unnormalized) variance of column i over the rows where both i and j are present,
+    so cov / sqrt(var * var.T) is the correlation and cov / var.T the beta of i to j.
+    """
+    mask = (~np.isnan(returns)).astype(float)
+    x = np.where(mask > 0, returns, 0.0)
+
+    n = mask.T @ mask
+    sum_x = x.T @ mask
+    sum_xx = (x * x).T @ mask
+    sum_xy = x.T @ x
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var = sum_xx - sum_x ** 2 / n
+
+    insufficient = n < MIN_PERIODS
+    cov[insufficient] = np.nan
+    var[insufficient] = np.nan
+    return n, cov, var
+
+
+def correlation_matrix(returns: np.ndarray) -> np.ndarray:
+    """Pairwise-complete Pearson correlation matrix of return columns"""
+    _, cov, var = _pairwise_moments(returns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cov / np.sqrt(var * var.T)
+
+
+def beta_matrix(returns: np.ndarray, benchmark_idx: List[int]) -> np.ndarray:
+    """Beta of every column to each benchmark column, shape (N, len(benchmark_idx))"""
+    _, cov, var = _pairwise_moments(returns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cov[:, benchmark_idx] / var.T[:, benchmark_idx]
+
+
+def _to_json(values: np.ndarray, decimals: int = 6) -> Any:
+    """Convert a float array to nested lists with NaN replaced by None"""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(values), np.round(values, decimals), None).tolist()
+
+
+def compute_analytics(
+    db: StockDatabase,
+    companies: List[str],
+    benchmarks: Optional[List[str]] = None,
+    lookback: int = DEFAULT_LOOKBACK,
+    window: int = DEFAULT_WINDOW
+) -> Dict[str, Any]:
+    """Compute returns, rolling volatility, benchmark betas and correlations for many companies.
+
+    Results are cached per data version, so repeated requests between ingests skip the database
+    and the computation entirely.
+    """
+    benchmarks = list(benchmarks) if benchmarks is not None else list(DEFAULT_BENCHMARKS)
+    version = db.get_data_version()
+    key = (version, tuple(sorted(companies)), tuple(benchmarks), lookback, window)
+
+    if version:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    # One query for the companies and their benchmarks; +1 row so the first return is available
+    rows = db.get_close_prices(sorted(set(companies) | set(benchmarks)), lookback + 1)
+    dates, symbols, panel = build_close_panel(rows)
+    returns = compute_returns(panel)
+    volatility = rolling_volatility(returns, window)
+    correlation = correlation_matrix(returns)
+
+    benchmark_symbols = [b for b in benchmarks if b in symbols]
+    betas = beta_matrix(returns, [symbols.index(b) for b in benchmark_symbols])
+
+    # First and last available close per symbol, for the period return
+    present = ~np.isnan(panel)
+    last_idx = panel.shape[0] - 1 - np.argmax(present[::-1], axis=0) if panel.size else np.array([], dtype=int)
+    first_idx = np.argmax(present, axis=0) if panel.size else np.array([], dtype=int)
+    columns = np.arange(len(symbols))
+    first_close = panel[first_idx, columns] if panel.size else np.array([])
+    last_close = panel[last_idx, columns] if panel.size else np.array([])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        period_return = last_close / first_close - 1.0
+
+    summary = []
+    for i, symbol in enumerate(symbols):
+        summary.append({
+            'company': symbol,
+            'last_date': str(dates[last_idx[i]]),
+            'last_close': _to_json(last_close[i]),
+            'last_return': _to_json(returns[-1, i]) if returns.shape[0] else None,
+            'period_return': _to_json(period_return[i]),
+            'volatility': _to_json(volatility[-1, i]) if volatility.shape[0] else None,
+            'beta': {b: _to_json(betas[i, j]) for j, b in enumerate(benchmark_symbols)}
+        })
+
+    result = {
+        'symbols': symbols,
+        'benchmarks': benchmark_symbols,
+        'lookback': lookback,
+        'window': window,
+        'start_date': str(dates[0]) if len(dates) else None,
+        'end_date': str(dates[-1]) if len(dates) else None,
+        'summary': summary,
+        'correlation': _to_json(correlation),
+        'volatility': {
+            'dates': [str(d) for d in dates[window:]],
+            'values': _to_json(volatility)
+        }
+    }
+
+    if version:
+        with _cache_lock:
+            _cache[key] = result
+            _cache.move_to_end(key)
+            while len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    logger.info(f"Computed analytics for {len(symbols)} symbols over {len(dates)} dates (version {version})")
+    return result
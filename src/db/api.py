@@ -1,14 +1,21 @@
 import os
 import sys
+import io
+import csv
+import json
 import logging
-from flask import Flask, jsonify, request
+from decimal import Decimal
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db.database import StockDatabase
-from utils import load_companies
+from db.journal import IngestJournal, JournalFlusher
+from db.quality import scan_companies, CHECKS
+from db.analytics import compute_analytics, DEFAULT_BENCHMARKS, DEFAULT_LOOKBACK, DEFAULT_WINDOW
+from utils import load_companies, load_db_config
 
 # 确保log目录存在 (修改为与src同级目录)
 log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'log')
@@ -37,17 +44,14 @@ app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests
 
 # Database configuration - Use environment variables
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'port': int(os.getenv('DB_PORT', 3306)),
-    'database': os.getenv('DB_NAME', 'stock_db'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', '')  # Get password from environment variable
-}
+DB_CONFIG = load_db_config()
 
 # Initialize database connection
 db = StockDatabase(**DB_CONFIG)
 
+# Whether the market snapshot has been checked for emptiness in this process
+_snapshot_checked = False
+
 @app.route('/api/stock/<company>/latest', methods=['GET'])
 def get_company_latest_stock_data(company):
     """Get the latest stock data for the specified company"""
@@ -89,6 +93,255 @@ def get_company_history_stock_data(company):
         }), 500
 
 
+@app.route('/api/market/latest', methods=['GET'])
+def get_market_latest_stock_data():
+    """Get the latest stock data for all (or the requested) companies"""
+    try:
+        # Optional comma separated filter, e.g. ?companies=AAPL,MSFT
+        companies_arg = request.args.get('companies', '')
+        companies = [c.strip().upper() for c in companies_arg.split(',') if c.strip()]
+        
+        global _snapshot_checked
+        if not _snapshot_checked:
+            # Snapshot not built yet (e.g. data ingested before the table existed), build it once
+            # Keep retrying on later requests until a snapshot actually exists
+            if db.get_market_snapshot():
+                _snapshot_checked = True
+            elif db.refresh_market_snapshot():
+                _snapshot_checked = bool(db.get_market_snapshot())
+        
+        snapshot = db.get_market_snapshot(companies or None)
+        
+        return jsonify({
+            'status': 'success',
+            'data': snapshot
+        })
+    except Exception as e:
+        logger.error(f"Error getting market latest stock data: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+MAX_EXPORT_CHUNK_SIZE = 10000
+
+EXPORT_COLUMNS = ['date', 'open_price', 'high_price', 'low_price', 'close_price',
+                  'volume', 'average', 'bar_count', 'company']
+
+
+def _json_default(value):
+    """Serialize DECIMAL columns as numbers"""
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _export_ndjson(chunks):
+    """Render record chunks as newline delimited JSON, one chunk per write"""
+    for records in chunks:
+        yield ''.join(json.dumps(record, default=_json_default) + '\n' for record in records)
+
+
+def _export_csv(chunks):
+    """Render record chunks as CSV with a header row sent before the first query result"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for records in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(records)
+        yield buffer.getvalue()
+
+
+def _export_response(company=None):
+    """Build a streaming export response for one company or all companies"""
+    export_format = request.args.get('format', 'ndjson').lower()
+    chunk_size = request.args.get('chunk_size', 1000, type=int)
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({
+            'status': 'error',
+            'message': f'Unsupported export format {export_format}, expected ndjson or csv'
+        }), 400
+    
+    # Bound rows fetched per chunk so memory stays flat whatever the client asks for
+    chunks = db.iter_stock_data(company, min(max(chunk_size, 1), MAX_EXPORT_CHUNK_SIZE))
+    filename = f"{company or 'stock_data'}.{export_format}"
+    if export_format == 'csv':
+        body, mimetype = _export_csv(chunks), 'text/csv'
+    else:
+        body, mimetype = _export_ndjson(chunks), 'application/x-ndjson'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@app.route('/api/stock/<company>/export', methods=['GET'])
+def export_company_stock_data(company):
+    """Stream the full history of the specified company as NDJSON or CSV"""
+    try:
+        return _export_response(company)
+    except Exception as e:
+        logger.error(f"Error exporting stock data for {company}: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/export', methods=['GET'])
+def export_all_stock_data():
+    """Stream the full history of all companies as NDJSON or CSV"""
+    try:
+        return _export_response()
+    except Exception as e:
+        logger.error(f"Error exporting stock data: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+def _analytics_request_args():
+    """Parse the query parameters shared by the analytics endpoints"""
+    companies_arg = request.args.get('companies', '')
+    companies = [c.strip().upper() for c in companies_arg.split(',') if c.strip()] or load_companies()
+    benchmarks_arg = request.args.get('benchmarks', ','.join(DEFAULT_BENCHMARKS))
+    benchmarks = [b.strip().upper() for b in benchmarks_arg.split(',') if b.strip()]
+    lookback = request.args.get('lookback', DEFAULT_LOOKBACK, type=int)
+    window = request.args.get('window', DEFAULT_WINDOW, type=int)
+    if lookback < 2 or window < 2:
+        raise ValueError("lookback and window must both be at least 2")
+    return companies, benchmarks, lookback, window
+
+
+@app.route('/api/analytics/summary', methods=['GET'])
+def get_analytics_summary():
+    """Get period return, volatility and benchmark betas for many companies"""
+    try:
+        companies, benchmarks, lookback, window = _analytics_request_args()
+        result = compute_analytics(db, companies, benchmarks, lookback, window)
+        return jsonify({
+            'status': 'success',
+            'data': {key: result[key] for key in
+                     ('symbols', 'benchmarks', 'lookback', 'window', 'start_date', 'end_date', 'summary')}
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting analytics summary: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/analytics/correlation', methods=['GET'])
+def get_analytics_correlation():
+    """Get the return correlation matrix for many companies"""
+    try:
+        companies, benchmarks, lookback, window = _analytics_request_args()
+        result = compute_analytics(db, companies, benchmarks, lookback, window)
+        return jsonify({
+            'status': 'success',
+            'data': {key: result[key] for key in
+                     ('symbols', 'lookback', 'start_date', 'end_date', 'correlation')}
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting analytics correlation: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/analytics/volatility', methods=['GET'])
+def get_analytics_volatility():
+    """Get the annualized rolling volatility series for many companies"""
+    try:
+        companies, benchmarks, lookback, window = _analytics_request_args()
+        result = compute_analytics(db, companies, benchmarks, lookback, window)
+        return jsonify({
+            'status': 'success',
+            'data': {key: result[key] for key in
+                     ('symbols', 'lookback', 'window', 'volatility')}
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting analytics volatility: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/quality/report', methods=['GET'])
+def get_quality_report():
+    """Get data-quality issues found by the last scan"""
+    try:
+        company = request.args.get('company')
+        check_name = request.args.get('check')
+        limit = request.args.get('limit', 500, type=int)
+        if check_name and check_name not in CHECKS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Unknown check {check_name}, expected one of {list(CHECKS)}'
+            }), 400
+        
+        report = db.get_quality_report(company.upper() if company else None, check_name, limit)
+        return jsonify({
+            'status': 'success',
+            'data': report
+        })
+    except Exception as e:
+        logger.error(f"Error getting data quality report: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/quality/scan', methods=['POST'])
+def run_quality_scan():
+    """Scan stored data for quality issues on demand"""
+    try:
+        companies_arg = request.args.get('companies', '')
+        companies = [c.strip().upper() for c in companies_arg.split(',') if c.strip()]
+        issue_counts = scan_companies(db, companies or None)
+        if issue_counts is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Could not read stored data for the quality scan'
+            }), 500
+        return jsonify({
+            'status': 'success',
+            'data': issue_counts
+        })
+    except Exception as e:
+        logger.error(f"Error running data quality scan: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
 def main():
     """Start the API service"""
     logger.info("Connecting to database...")
@@ -109,6 +362,10 @@ def main():
             logger.info("   export DB_PASSWORD=your_password")
             sys.exit(1)
         
+        # Replay journaled bars in the background with a dedicated connection
+        flusher = JournalFlusher(IngestJournal(), StockDatabase(**DB_CONFIG))
+        flusher.start()
+        
         host = os.getenv('API_HOST', '0.0.0.0')
         port = int(os.getenv('API_PORT', 5000))
         
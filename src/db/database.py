@@ -1,6 +1,6 @@
 import os
 import logging
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator
 import mysql.connector
 from mysql.connector import Error
 import csv
@@ -23,6 +23,31 @@ if not logger.handlers:
     # 添加处理器到logger
     logger.addHandler(console_handler)
 
+def _bar_value(value, cast=float):
+    """Convert a CSV/JSON bar field, treating empty strings and NaN as missing"""
+    if value is None or value == '':
+        return None
+    value = float(value)
+    if value != value:
+        return None
+    return cast(value)
+
+
+def bar_to_record(bar: Dict[str, Any], company: str) -> tuple:
+    """Convert an IB bar (CSV row or DataFrame record) into a stock_data insert tuple"""
+    return (
+        str(bar['date']),
+        _bar_value(bar['open']),
+        _bar_value(bar['high']),
+        _bar_value(bar['low']),
+        _bar_value(bar['close']),
+        _bar_value(bar['volume']),
+        _bar_value(bar['average']),
+        _bar_value(bar['barCount'], int),
+        company
+    )
+
+
 class StockDatabase:
     """Class for handling stock data interaction with MySQL database"""
     
@@ -55,6 +80,15 @@ class StockDatabase:
             logger.error(f"Error connecting to MySQL database: {e}")
             return False
     
+    def ensure_connected(self) -> bool:
+        """Reconnect if the connection was never opened or has been lost"""
+        try:
+            if self.connection and self.connection.is_connected():
+                return True
+        except Error:
+            pass
+        return bool(self.connect())
+    
     def disconnect(self):
         """Disconnect from database"""
         if self.connection and self.connection.is_connected():
@@ -79,11 +113,68 @@ class StockDatabase:
                 average DECIMAL(10, 4),
                 bar_count INT,
                 company VARCHAR(10) NOT NULL,
-                UNIQUE KEY unique_date_company (date, company)
+                UNIQUE KEY unique_date_company (date, company),
+                KEY idx_company_date (company, date)
             )
             """
             
             cursor.execute(create_table_query)
+            
+            # Tables created before idx_company_date existed need it added explicitly;
+            # per-company scans and the streaming export read rows in this order
+            cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'stock_data' AND index_name = 'idx_company_date'
+            """)
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("CREATE INDEX idx_company_date ON stock_data (company, date)")
+            
+            # Latest bar per company, refreshed on ingest by refresh_market_snapshot()
+            create_snapshot_query = """
+            CREATE TABLE IF NOT EXISTS market_snapshot (
+                company VARCHAR(10) NOT NULL PRIMARY KEY,
+                date DATE NOT NULL,
+                open_price DECIMAL(10, 4),
+                high_price DECIMAL(10, 4),
+                low_price DECIMAL(10, 4),
+                close_price DECIMAL(10, 4),
+                volume DECIMAL(15, 2),
+                average DECIMAL(10, 4),
+                bar_count INT,
+                prev_close DECIMAL(10, 4),
+                change_amount DECIMAL(10, 4),
+                change_pct DECIMAL(10, 4),
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            )
+            """
+            
+            cursor.execute(create_snapshot_query)
+            
+            # Issues found by the data-quality scanner (db.quality), replaced per company on each scan
+            create_quality_query = """
+            CREATE TABLE IF NOT EXISTS data_quality_report (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                company VARCHAR(10) NOT NULL,
+                date DATE NOT NULL,
+                check_name VARCHAR(32) NOT NULL,
+                value DECIMAL(20, 6),
+                detail VARCHAR(255),
+                scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY unique_company_date_check (company, date, check_name)
+            )
+            """
+            
+            cursor.execute(create_quality_query)
+            
+            # Single-row counter bumped by every insert_records() call, used as the analytics cache key
+            create_version_query = """
+            CREATE TABLE IF NOT EXISTS data_version (
+                id TINYINT PRIMARY KEY,
+                version BIGINT NOT NULL
+            )
+            """
+            
+            cursor.execute(create_version_query)
             self.connection.commit()
             cursor.close()
             logger.info("Stock data table created successfully")
@@ -96,54 +187,67 @@ class StockDatabase:
     def insert_stock_data(self, csv_file_path: str, company: str) -> bool:
         """Insert stock data from CSV file into database"""
         try:
-            cursor = self.connection.cursor()
-            
             # Read CSV file and insert data
             with open(csv_file_path, 'r') as file:
                 csv_reader = csv.DictReader(file)
-                # Use ON DUPLICATE KEY UPDATE to handle duplicate data
-                insert_query = """
-                INSERT INTO stock_data 
-                (date, open_price, high_price, low_price, close_price, volume, average, bar_count, company)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                open_price = VALUES(open_price),
-                high_price = VALUES(high_price),
-                low_price = VALUES(low_price),
-                close_price = VALUES(close_price),
-                volume = VALUES(volume),
-                average = VALUES(average),
-                bar_count = VALUES(bar_count)
-                """
-                
-                records = []
-                for row in csv_reader:
-                    record = (
-                        row['date'],
-                        float(row['open']) if row['open'] else None,
-                        float(row['high']) if row['high'] else None,
-                        float(row['low']) if row['low'] else None,
-                        float(row['close']) if row['close'] else None,
-                        float(row['volume']) if row['volume'] else None,
-                        float(row['average']) if row['average'] else None,
-                        int(float(row['barCount'])) if row['barCount'] else None,
-                        company
-                    )
-                    records.append(record)
-                
-                cursor.executemany(insert_query, records)
-                self.connection.commit()
-                logger.info(f"Successfully inserted or updated {cursor.rowcount} {company} stock data records")
+                records = [bar_to_record(row, company) for row in csv_reader]
             
-            cursor.close()
+        except Exception as e:
+            logger.error(f"Error processing CSV file: {e}")
+            return False
+        
+        try:
+            self.insert_records(records)
             return True
+        except Error:
+            return False
+    
+    def insert_records(self, records: List[tuple]):
+        """Bulk insert or update records built by bar_to_record().
+
+        Raises mysql.connector.Error after rolling back, so callers can tell rejected data
+        (e.g. out-of-range values) from an unreachable or misconfigured database.
+        """
+        try:
+            cursor = self.connection.cursor()
+            
+            # Use ON DUPLICATE KEY UPDATE to handle duplicate data
+            insert_query = """
+            INSERT INTO stock_data 
+            (date, open_price, high_price, low_price, close_price, volume, average, bar_count, company)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            open_price = VALUES(open_price),
+            high_price = VALUES(high_price),
+            low_price = VALUES(low_price),
+            close_price = VALUES(close_price),
+            volume = VALUES(volume),
+            average = VALUES(average),
+            bar_count = VALUES(bar_count)
+            """
+            
+            cursor.executemany(insert_query, records)
+            inserted = cursor.rowcount
+            # Bump the data version in the same transaction so readers never see new rows with an old version
+            cursor.execute("""
+            INSERT INTO data_version (id, version) VALUES (1, 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+            """)
+            self.connection.commit()
+            companies = sorted({record[-1] for record in records})
+            logger.info(f"Successfully inserted or updated {inserted} stock data records for {companies}")
+            cursor.close()
+            
+            if companies:
+                self.refresh_market_snapshot(companies)
             
         except Error as e:
             logger.error(f"Error inserting stock data: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Error processing CSV file: {e}")
-            return False
+            try:
+                self.connection.rollback()
+            except Error:
+                pass
+            raise
     
     def get_stock_data(self, company: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Get stock data from database"""
@@ -207,4 +311,301 @@ class StockDatabase:
             
         except Error as e:
             logger.error(f"Error querying latest stock data: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    def refresh_market_snapshot(self, companies: Optional[List[str]] = None) -> bool:
+        """Rebuild the latest-bar snapshot for the given companies (all if None)"""
+        try:
+            cursor = self.connection.cursor()
+            
+            where_clause = ""
+            params: tuple = ()
+            if companies:
+                where_clause = f"WHERE company IN ({', '.join(['%s'] * len(companies))})"
+                params = tuple(companies)
+            
+            # Greatest-per-group: rank bars per company and keep the newest one,
+            # carrying the previous close along for the day-over-day change
+            refresh_query = f"""
+            REPLACE INTO market_snapshot
+            (company, date, open_price, high_price, low_price, close_price, volume, average, bar_count,
+             prev_close, change_amount, change_pct)
+            SELECT company, date, open_price, high_price, low_price, close_price, volume, average, bar_count,
+                   prev_close,
+                   close_price - prev_close,
+                   (close_price - prev_close) / NULLIF(prev_close, 0) * 100
+            FROM (
+                SELECT date, open_price, high_price, low_price, close_price, volume, average, bar_count, company,
+                       LAG(close_price) OVER (PARTITION BY company ORDER BY date) AS prev_close,
+                       ROW_NUMBER() OVER (PARTITION BY company ORDER BY date DESC) AS rn
+                FROM stock_data
+                {where_clause}
+            ) ranked
+            WHERE rn = 1
+            """
+            
+            cursor.execute(refresh_query, params)
+            self.connection.commit()
+            logger.info(f"Refreshed market snapshot for {cursor.rowcount} rows")
+            cursor.close()
+            return True
+            
+        except Error as e:
+            logger.error(f"Error refreshing market snapshot: {e}")
+            return False
+    
+    def get_market_snapshot(self, companies: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Get the latest bar and day-over-day change for the given companies (all if None)"""
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            
+            select_query = """
+            SELECT company, date, open_price, high_price, low_price, close_price, volume, average, bar_count,
+                   prev_close, change_amount, change_pct
+            FROM market_snapshot
+            """
+            params: tuple = ()
+            if companies:
+                select_query += f" WHERE company IN ({', '.join(['%s'] * len(companies))})"
+                params = tuple(companies)
+            select_query += " ORDER BY company"
+            
+            # End the connection's open transaction first; under REPEATABLE READ it would keep
+            # serving the snapshot from its first read and hide refreshes committed by other connections
+            self.connection.commit()
+            cursor.execute(select_query, params)
+            records = cursor.fetchall()
+            cursor.close()
+            
+            # Convert date format
+            for record in records:
+                if record['date']:
+                    record['date'] = record['date'].strftime('%Y-%m-%d')
+            
+            return records
+            
+        except Error as e:
+            logger.error(f"Error querying market snapshot: {e}")
+            return []
+    
+    def get_close_prices(self, companies: List[str], lookback: Optional[int] = None) -> List[tuple]:
+        """Get (company, date, close_price) rows for many companies in one query, oldest first"""
+        try:
+            cursor = self.connection.cursor()
+            
+            placeholders = ', '.join(['%s'] * len(companies))
+            select_query = f"""
+            SELECT company, date, close_price
+            FROM stock_data
+            WHERE company IN ({placeholders})
+            """
+            params = list(companies)
+            if lookback:
+                # Restrict to the most recent `lookback` trading dates across the table
+                select_query += """
+                AND date >= (
+                    SELECT MIN(date) FROM (
+                        SELECT DISTINCT date FROM stock_data ORDER BY date DESC LIMIT %s
+                    ) recent_dates
+                )
+                """
+                params.append(lookback)
+            select_query += " ORDER BY date"
+            
+            cursor.execute(select_query, tuple(params))
+            records = cursor.fetchall()
+            cursor.close()
+            return records
+            
+        except Error as e:
+            logger.error(f"Error querying close prices: {e}")
+            return []
+    
+    def get_data_version(self) -> str:
+        """Get a token that changes whenever stock data is ingested"""
+        try:
+            cursor = self.connection.cursor()
+            
+            # End the connection's open transaction first so versions committed by other
+            # connections are visible, then do a primary key lookup on the counter
+            self.connection.commit()
+            cursor.execute("SELECT version FROM data_version WHERE id = 1")
+            row = cursor.fetchone()
+            cursor.close()
+            return str(row[0]) if row else "0"
+            
+        except Error as e:
+            logger.error(f"Error querying data version: {e}")
+            return ""
+    
+    def get_ohlcv(self, companies: Optional[List[str]] = None) -> Optional[List[tuple]]:
+        """Get (company, date, open, high, low, close, volume) rows ordered by company and date.
+
+        Returns None if the query fails, so callers can tell an error from companies without bars.
+        """
+        try:
+            cursor = self.connection.cursor()
+            
+            select_query = """
+            SELECT company, date, open_price, high_price, low_price, close_price, volume
+            FROM stock_data
+            """
+            params: tuple = ()
+            if companies:
+                select_query += f" WHERE company IN ({', '.join(['%s'] * len(companies))})"
+                params = tuple(companies)
+            select_query += " ORDER BY company, date"
+            
+            cursor.execute(select_query, params)
+            records = cursor.fetchall()
+            cursor.close()
+            return records
+            
+        except Error as e:
+            logger.error(f"Error querying OHLCV data: {e}")
+            return None
+    
+    def get_trading_dates(self) -> Optional[List[Any]]:
+        """Get every date that has a bar for at least one company, oldest first; None on error"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT DISTINCT date FROM stock_data ORDER BY date")
+            dates = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            return dates
+            
+        except Error as e:
+            logger.error(f"Error querying trading dates: {e}")
+            return None
+    
+    def save_quality_report(self, company: str, issues: List[Dict[str, Any]]) -> bool:
+        """Replace the data-quality issues stored for a company"""
+        try:
+            cursor = self.connection.cursor()
+            
+            cursor.execute("DELETE FROM data_quality_report WHERE company = %s", (company,))
+            if issues:
+                insert_query = """
+                INSERT INTO data_quality_report (company, date, check_name, value, detail)
+                VALUES (%s, %s, %s, %s, %s)
+                """
+                records = [
+                    (company, issue['date'], issue['check_name'], issue['value'], issue['detail'])
+                    for issue in issues
+                ]
+                cursor.executemany(insert_query, records)
+            
+            self.connection.commit()
+            cursor.close()
+            return True
+            
+        except Error as e:
+            logger.error(f"Error saving data quality report for {company}: {e}")
+            return False
+    
+    def get_quality_report(self, company: Optional[str] = None, check_name: Optional[str] = None,
+                           limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get stored data-quality issues, newest dates first"""
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            
+            select_query = """
+            SELECT company, date, check_name, value, detail, scanned_at
+            FROM data_quality_report
+            """
+            conditions = []
+            params = []
+            if company:
+                conditions.append("company = %s")
+                params.append(company)
+            if check_name:
+                conditions.append("check_name = %s")
+                params.append(check_name)
+            if conditions:
+                select_query += " WHERE " + " AND ".join(conditions)
+            select_query += " ORDER BY date DESC, company"
+            if limit:
+                select_query += " LIMIT %s"
+                params.append(limit)
+            
+            cursor.execute(select_query, tuple(params))
+            records = cursor.fetchall()
+            cursor.close()
+            
+            # Convert date format
+            for record in records:
+                if record['date']:
+                    record['date'] = record['date'].strftime('%Y-%m-%d')
+                if record['scanned_at']:
+                    record['scanned_at'] = record['scanned_at'].strftime('%Y-%m-%d %H:%M:%S')
+            
+            return records
+            
+        except Error as e:
+            logger.error(f"Error querying data quality report: {e}")
+            return []
+    
+    def iter_stock_data(self, company: Optional[str] = None,
+                        chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Stream stock data for a company (all companies if None) in chunks, oldest first.
+        
+        Uses a dedicated connection with an unbuffered cursor so only one chunk is held in
+        memory at a time and the shared connection stays free for other requests. The
+        connection and query run before returning, so their errors reach the caller directly
+        rather than surfacing halfway through a streamed response.
+        """
+        connection = mysql.connector.connect(
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            user=self.user,
+            password=self.password
+        )
+        cursor = None
+        try:
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            select_query = """
+            SELECT date, open_price, high_price, low_price, close_price, volume, average, bar_count, company
+            FROM stock_data
+            """
+            params: tuple = ()
+            if company:
+                select_query += " WHERE company = %s"
+                params = (company,)
+            # Matches idx_company_date, so rows stream in index order without a filesort
+            select_query += " ORDER BY company, date"
+            cursor.execute(select_query, params)
+        except Exception:
+            self._close_stream(connection, cursor)
+            raise
+        
+        return self._stream_chunks(connection, cursor, chunk_size)
+    
+    def _stream_chunks(self, connection, cursor, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Yield fetchmany() chunks from an executed cursor, closing the connection at the end"""
+        try:
+            while True:
+                records = cursor.fetchmany(chunk_size)
+                if not records:
+                    break
+                
+                # Convert date format
+                for record in records:
+                    if record['date']:
+                        record['date'] = record['date'].strftime('%Y-%m-%d')
+                
+                yield records
+        
+        finally:
+            self._close_stream(connection, cursor)
+    
+    @staticmethod
+    def _close_stream(connection, cursor):
+        """Close a streaming cursor and its dedicated connection"""
+        # Closing an unbuffered cursor with unread rows raises, drop them with the connection
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Error:
+                pass
+        connection.close()
@@ -7,7 +7,8 @@ import glob
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db.database import StockDatabase
-from utils import COMPANY, load_companies
+from db.quality import scan_companies
+from utils import COMPANY, load_companies, load_db_config
 
 # 确保log目录存在 (修改为与src同级目录)
 log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'log')
@@ -46,13 +47,7 @@ def find_csv_files(data_path, company):
 def main():
     """Initialize database and import CSV data"""
     # Database configuration
-    DB_CONFIG = {
-        'host': os.getenv('DB_HOST', 'localhost'),
-        'port': int(os.getenv('DB_PORT', 3306)),
-        'database': os.getenv('DB_NAME', 'stock_db'),
-        'user': os.getenv('DB_USER', 'root'),
-        'password': os.getenv('DB_PASSWORD', '')  # Get password from environment variable
-    }
+    DB_CONFIG = load_db_config()
     
     logger.info("Connecting to database...")
     logger.info(f"Database configuration: {DB_CONFIG}")
@@ -123,6 +118,11 @@ def main():
                 logger.info(f"{company} latest data: {latest_data}")
             else:
                 logger.warning(f"Could not get latest data for {company}")
+        
+        # Check the imported bars for gaps, inconsistent OHLC values and price jumps
+        logger.info("Scanning imported data for quality issues...")
+        issue_counts = scan_companies(db, companies)
+        logger.info(f"Data quality issues per company: {issue_counts}")
             
     except Exception as e:
         logger.error(f"Error during initialization: {e}")
@@ -132,5 +132,26 @@ def main():
         # Close database connection
         db.disconnect()
 
+def scan_main():
+    """Run the data-quality scan over all stored companies"""
+    db = StockDatabase(**load_db_config())
+    
+    try:
+        if not db.connect():
+            logger.error("Failed to connect to database")
+            sys.exit(1)
+        
+        issue_counts = scan_companies(db)
+        if issue_counts is None:
+            sys.exit(1)
+        logger.info(f"Data quality issues per company: {issue_counts}")
+    
+    except Exception as e:
+        logger.error(f"Error during data quality scan: {e}")
+        sys.exit(1)
+    
+    finally:
+        db.disconnect()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
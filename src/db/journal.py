@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import glob
+import logging
+import threading
+from typing import List, Dict, Optional, Any
+
+from mysql.connector import Error
+
+from db.database import StockDatabase, bar_to_record
+from db.quality import scan_companies
+
+# 为journal模块创建独立的日志配置
+logger = logging.getLogger('db.journal')
+
+# Suffix of segments being replayed, and how long before a claim is considered abandoned
+CLAIM_SUFFIX = '.replaying'
+STALE_CLAIM_SECONDS = 600
+
+# MySQL errors caused by the bars themselves: out of range value (1264), data truncated (1265),
+# incorrect date/datetime value (1292), incorrect number value (1366), data too long (1406)
+# and NOT NULL column given NULL (1048). Anything else (lost connection, lock wait timeout,
+# deadlock, missing table, ...) says nothing about the segment and is retried later.
+DATA_ERRNOS = {1048, 1264, 1265, 1292, 1366, 1406}
+
+# Journal directory at the same level as src
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'journal')
+
+
+class IngestJournal:
+    """Local append-only buffer of fetched bars that have not reached the database yet.
+
+    Every append() writes one immutable segment file (one JSON bar per line) which only becomes
+    visible to replay() once it is fully written and fsynced, so a crash never leaves a half
+    segment behind. Replay is idempotent thanks to the (date, company) unique key, so a segment
+    is simply deleted after its bars are committed and re-sent if anything fails before that.
+
+    Several processes may replay the same directory, so a segment is claimed by renaming it to
+    `.replaying` before it is read. Segments whose bars the database rejects as invalid data are
+    moved to `rejected/` instead of blocking every later segment; requeue_rejected() puts them
+    back once the data or schema has been fixed.
+    """
+
+    def __init__(self, journal_dir: str = DEFAULT_JOURNAL_DIR):
+        self.journal_dir = journal_dir
+        self.rejected_dir = os.path.join(journal_dir, 'rejected')
+        self._lock = threading.Lock()
+        os.makedirs(self.rejected_dir, exist_ok=True)
+
+    def append(self, company: str, bars: List[Dict[str, Any]]) -> str:
+        """Durably write bars for a company and return the segment path"""
+        filename = f"{time.time_ns():020d}-{os.getpid()}-{company}.jsonl"
+        path = os.path.join(self.journal_dir, filename)
+        tmp_path = os.path.join(self.journal_dir, f".{filename}.tmp")
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for bar in bars:
+                f.write(json.dumps({**bar, 'company': company}, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        logger.info(f"Journaled {len(bars)} {company} bars to {path}")
+        return path
+
+    def pending_segments(self) -> List[str]:
+        """Segments waiting to be replayed, oldest first"""
+        return sorted(glob.glob(os.path.join(self.journal_dir, '*.jsonl')))
+
+    def _read_segment(self, path: str) -> List[tuple]:
+        """Read a segment into insert records, skipping unreadable lines"""
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    bar = json.loads(line)
+                    records.append(bar_to_record(bar, bar['company']))
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Skipping bad journal line {path}:{line_no}: {e}")
+        return records
+
+    def _claim(self, segment: str) -> Optional[str]:
+        """Rename a pending segment so no other replayer picks it up; None if already claimed"""
+        claimed = f"{segment}{CLAIM_SUFFIX}"
+        try:
+            os.rename(segment, claimed)
+        except FileNotFoundError:
+            return None
+        # Stamp the claim time so stale claims from a crashed replayer can be recognised
+        os.utime(claimed)
+        return claimed
+
+    def _release(self, claimed: str):
+        """Return a claimed segment to the pending set"""
+        try:
+            os.rename(claimed, claimed[:-len(CLAIM_SUFFIX)])
+        except FileNotFoundError:
+            pass
+
+    def _release_stale_claims(self):
+        """Release segments claimed by a replayer that died before finishing them"""
+        now = time.time()
+        for claimed in glob.glob(os.path.join(self.journal_dir, f'*.jsonl{CLAIM_SUFFIX}')):
+            try:
+                if now - os.path.getmtime(claimed) > STALE_CLAIM_SECONDS:
+                    logger.warning(f"Releasing stale journal claim {claimed}")
+                    self._release(claimed)
+            except FileNotFoundError:
+                pass
+
+    def _reject(self, claimed: str, error: Error):
+        """Move a segment whose bars the database refuses out of the replay path"""
+        name = os.path.basename(claimed)[:-len(CLAIM_SUFFIX)]
+        target = os.path.join(self.rejected_dir, name)
+        os.replace(claimed, target)
+        logger.error(f"Database rejected journal segment ({error}), moved to {target}")
+
+    def requeue_rejected(self) -> int:
+        """Move rejected segments back to the pending set and return how many were moved"""
+        with self._lock:
+            requeued = 0
+            for rejected in sorted(glob.glob(os.path.join(self.rejected_dir, '*.jsonl'))):
+                try:
+                    os.replace(rejected, os.path.join(self.journal_dir, os.path.basename(rejected)))
+                    requeued += 1
+                except FileNotFoundError:
+                    pass
+            if requeued:
+                logger.info(f"Requeued {requeued} rejected journal segments")
+            return requeued
+
+    @staticmethod
+    def _remove(claimed: str):
+        try:
+            os.remove(claimed)
+        except FileNotFoundError:
+            pass
+
+    def replay(self, db: StockDatabase, batch_size: int = 5000) -> int:
+        """Insert pending segments into the database in bulk batches.
+
+        When a batch fails with anything but a data error (database unreachable or slow, missing
+        table, deadlock, ...), replay stops and leaves the batch and every later segment for the
+        next attempt. When the database rejects the bars themselves, the batch is retried segment
+        by segment and segments that still fail are moved to `rejected/`. Returns the number of
+        records committed.
+        """
+        with self._lock:
+            self._release_stale_claims()
+            flushed = 0
+            companies = set()
+            batch: List[tuple] = []
+            batch_segments: List[tuple] = []  # (claimed path, records)
+
+            def insert(records: List[tuple]) -> Optional[Error]:
+                """Insert records; the error if the database refused them, None on success"""
+                if not records:
+                    return None
+                try:
+                    db.insert_records(records)
+                except Error as e:
+                    return e
+                nonlocal flushed
+                flushed += len(records)
+                companies.update(record[-1] for record in records)
+                return None
+
+            def flush_batch() -> bool:
+                """Commit the current batch; False if replay should stop and retry later"""
+                if not batch_segments:
+                    return True
+                error = insert(batch)
+                if error is None:
+                    for claimed, _ in batch_segments:
+                        self._remove(claimed)
+                    return True
+
+                start = 0
+                if error.errno in DATA_ERRNOS:
+                    # Retry segment by segment so only the ones with invalid bars are rejected
+                    for start, (claimed, records) in enumerate(batch_segments):
+                        error = insert(records)
+                        if error is None:
+                            self._remove(claimed)
+                        elif error.errno in DATA_ERRNOS:
+                            self._reject(claimed, error)
+                        else:
+                            break
+                    else:
+                        return True
+
+                logger.warning(f"Journal replay paused by database error: {error}")
+                for pending, _ in batch_segments[start:]:
+                    self._release(pending)
+                return False
+
+            for segment in self.pending_segments():
+                claimed = self._claim(segment)
+                if claimed is None:
+                    continue
+                records = self._read_segment(claimed)
+                batch.extend(records)
+                batch_segments.append((claimed, records))
+                if len(batch) >= batch_size:
+                    if not flush_batch():
+                        break
+                    batch, batch_segments = [], []
+            else:
+                flush_batch()
+
+            if flushed:
+                logger.info(f"Replayed {flushed} journaled records for {sorted(companies)}")
+                scan_companies(db, sorted(companies))
+            return flushed
+
+
+class JournalFlusher(threading.Thread):
+    """Background thread that replays the journal whenever the database is reachable"""
+
+    def __init__(self, journal: IngestJournal, db: StockDatabase,
+                 interval: float = 5.0, max_backoff: float = 300.0):
+        super().__init__(name='journal-flusher', daemon=True)
+        self.journal = journal
+        self.db = db  # Dedicated connection, MySQL connections are not shared across threads
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._stop_event = threading.Event()
+
+    def flush_once(self) -> Optional[int]:
+        """Replay pending segments; None if there was work but the database is unavailable"""
+        if not self.journal.pending_segments():
+            return 0
+        if not self.db.ensure_connected():
+            return None
+        return self.journal.replay(self.db)
+
+    def run(self):
+        delay = self.interval
+        while not self._stop_event.is_set():
+            try:
+                flushed = self.flush_once()
+                pending = self.journal.pending_segments()
+            except Exception as e:
+                logger.error(f"Error flushing ingest journal: {e}")
+                flushed, pending = None, True
+
+            if flushed is None or (pending and not flushed):
+                # Database down or rejecting writes, back off exponentially
+                delay = min(delay * 2, self.max_backoff)
+                logger.warning(f"Ingest journal not flushed, retrying in {delay:.0f}s")
+            else:
+                delay = self.interval
+            self._stop_event.wait(delay)
+
+        self.db.disconnect()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the flusher and wait for the current replay to finish"""
+        self._stop_event.set()
+        self.join(timeout)
@@ -0,0 +1,153 @@
+import logging
+from typing import List, Dict, Optional, Any
+
+import numpy as np
+
+from db.database import StockDatabase
+
+# 为quality模块创建独立的日志配置
+logger = logging.getLogger('db.quality')
+
+# Absolute daily log return above which a bar is flagged as a price jump (~22%)
+DEFAULT_JUMP_THRESHOLD = 0.2
+
+CHECKS = (
+    'missing_day',
+    'duplicate_date',
+    'missing_value',
+    'ohlc_inconsistent',
+    'non_positive_volume',
+    'price_jump'
+)
+
+
+def split_by_company(rows: List[tuple]) -> Dict[str, Dict[str, np.ndarray]]:
+    """Split (company, date, open, high, low, close, volume) rows, ordered by company and date,
+    into per-company column arrays"""
+    if not rows:
+        return {}
+
+    companies, dates, opens, highs, lows, closes, volumes = zip(*rows)
+    companies = np.array(companies)
+    columns = {
+        'date': np.array(dates, dtype='datetime64[D]'),
+        'open': np.array(opens, dtype=float),
+        'high': np.array(highs, dtype=float),
+        'low': np.array(lows, dtype=float),
+        'close': np.array(closes, dtype=float),
+        'volume': np.array(volumes, dtype=float)
+    }
+
+    # Rows are grouped by company, so each company is one contiguous slice
+    symbols, starts = np.unique(companies, return_index=True)
+    order = np.argsort(starts)
+    symbols, starts = symbols[order], starts[order]
+    ends = np.append(starts[1:], len(companies))
+
+    return {
+        str(symbol): {name: values[start:end] for name, values in columns.items()}
+        for symbol, start, end in zip(symbols, starts, ends)
+    }
+
+
+def _issues(dates: np.ndarray, check_name: str, values: np.ndarray, detail: str) -> List[Dict[str, Any]]:
+    """Build report rows for the flagged dates"""
+    return [
+        {
+            'date': date,
+            'check_name': check_name,
+            'value': None if value is None or np.isnan(value) else round(float(value), 6),
+            'detail': detail
+        }
+        for date, value in zip(dates.astype(object), values)
+    ]
+
+
+def scan_arrays(
+    bars: Dict[str, np.ndarray],
+    calendar: Optional[np.ndarray] = None,
+    jump_threshold: float = DEFAULT_JUMP_THRESHOLD
+) -> List[Dict[str, Any]]:
+    """Run every data-quality check over one company's column arrays.
+
+    `calendar` is the set of known trading days (datetime64[D]); any of them falling inside the
+    company's date range without a bar is reported as a missing day.
+    """
+    dates = bars['date']
+    if len(dates) == 0:
+        return []
+
+    opens, highs, lows, closes, volumes = bars['open'], bars['high'], bars['low'], bars['close'], bars['volume']
+    issues = []
+
+    if calendar is not None and len(calendar):
+        in_range = calendar[(calendar >= dates[0]) & (calendar <= dates[-1])]
+        missing = in_range[~np.isin(in_range, dates)]
+        issues += _issues(missing, 'missing_day', np.full(len(missing), np.nan),
+                          'No bar on a day other symbols traded')
+
+    duplicated = np.flatnonzero(dates[1:] == dates[:-1]) + 1
+    issues += _issues(dates[duplicated], 'duplicate_date', np.full(len(duplicated), np.nan),
+                      'More than one bar for the same date')
+
+    prices = np.column_stack([opens, highs, lows, closes])
+    missing_value = np.isnan(prices).any(axis=1)
+    issues += _issues(dates[missing_value], 'missing_value', np.full(missing_value.sum(), np.nan),
+                      'Open, high, low or close is empty')
+
+    # NaN comparisons are False, so bars with missing prices are only reported once above
+    inconsistent = (
+        (highs < lows)
+        | (closes > highs) | (closes < lows)
+        | (opens > highs) | (opens < lows)
+        | (prices <= 0).any(axis=1)
+    )
+    issues += _issues(dates[inconsistent], 'ohlc_inconsistent', closes[inconsistent],
+                      'High below low, open/close outside the high-low range or non-positive price')
+
+    non_positive_volume = ~(volumes > 0)
+    issues += _issues(dates[non_positive_volume], 'non_positive_volume', volumes[non_positive_volume],
+                      'Volume is zero, negative or empty')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.log(closes[1:] / closes[:-1])
+    jumps = np.flatnonzero(np.abs(log_returns) > jump_threshold)
+    issues += _issues(dates[jumps + 1], 'price_jump', log_returns[jumps],
+                      f'Absolute log return above {jump_threshold}')
+
+    return issues
+
+
+def scan_companies(
+    db: StockDatabase,
+    companies: Optional[List[str]] = None,
+    jump_threshold: float = DEFAULT_JUMP_THRESHOLD
+) -> Optional[Dict[str, int]]:
+    """Scan stored bars for the given companies (all if None) and replace their report rows.
+
+    Returns the number of issues found per company, or None if the bars could not be read,
+    in which case the stored reports are left untouched.
+    """
+    rows = db.get_ohlcv(companies)
+    trading_dates = db.get_trading_dates()
+    if rows is None or trading_dates is None:
+        logger.error("Data quality scan skipped, could not read stored bars")
+        return None
+    calendar = np.array(trading_dates, dtype='datetime64[D]')
+
+    counts = {}
+    bars_by_company = split_by_company(rows)
+    for company, bars in bars_by_company.items():
+        issues = scan_arrays(bars, calendar, jump_threshold)
+        if db.save_quality_report(company, issues):
+            counts[company] = len(issues)
+        if issues:
+            logger.warning(f"Data quality: {len(issues)} issues found for {company}")
+
+    # Requested companies without any bars left must not keep issues from an earlier scan
+    for company in companies or []:
+        if company not in bars_by_company and db.save_quality_report(company, []):
+            counts[company] = 0
+
+    logger.info(f"Data quality scan finished for {len(counts)} companies, {sum(counts.values())} issues")
+    return counts
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import List, Dict, Optional, Any
+
+from ib_insync import IB, Stock, Contract
+
+# 确保log目录存在 (修改为与src同级目录)
+log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'log')
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# 为contract_cache模块创建独立的日志配置
+logger = logging.getLogger('ib.contract_cache')
+
+# 只有在logger没有处理器时才添加处理器，避免重复
+if not logger.handlers:
+    logger.setLevel(logging.INFO)
+    
+    # 创建文件处理器, 与ib_connect共用日志文件
+    file_handler = logging.FileHandler(os.path.join(log_dir, 'ib_connect.log'), encoding='utf-8')
+    file_handler.setLevel(logging.INFO)
+    
+    # 创建日志格式
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+    
+    # 添加处理器到logger
+    logger.addHandler(file_handler)
+
+# Cache file at the same level as src
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  'cache', 'contracts.json')
+DEFAULT_TTL = 7 * 24 * 3600  # Re-qualify contracts weekly
+DEFAULT_FAILURE_TTL = 3600  # Retry symbols that could not be resolved after an hour
+
+# Primary listings preferred when a symbol is ambiguous on SMART, in order of preference
+US_PRIMARY_EXCHANGES = ('NASDAQ', 'NYSE', 'ARCA', 'AMEX', 'BATS', 'IEX')
+
+CONTRACT_FIELDS = ('conId', 'symbol', 'secType', 'exchange', 'primaryExchange', 'currency', 'localSymbol')
+
+
+class ContractCache:
+    """Qualified IB contracts persisted to disk so symbols are resolved once, not on every request"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 failure_ttl: float = DEFAULT_FAILURE_TTL, exchange: str = 'SMART', currency: str = 'USD'):
+        self.path = path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.exchange = exchange
+        self.currency = currency
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read cached contracts, starting empty if the file is missing or unreadable"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+            logger.info(f"Loaded {len(self._entries)} cached contracts from {self.path}")
+        except FileNotFoundError:
+            self._entries = {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable contract cache {self.path}: {e}")
+            self._entries = {}
+
+    def save(self):
+        """Atomically write the cache file"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        ttl = self.failure_ttl if entry.get('failed') else self.ttl
+        return time.time() - entry.get('qualified_at', 0) < ttl
+
+    def get(self, symbol: str) -> Optional[Contract]:
+        """Return the cached qualified contract, or None if missing, expired or unresolvable"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if not entry or entry.get('failed') or not self._is_fresh(entry):
+                return None
+            fields = {field: entry[field] for field in CONTRACT_FIELDS if entry.get(field)}
+            return Contract(**fields)
+
+    def qualify(self, ib: IB, symbols: List[str]) -> Dict[str, Contract]:
+        """Qualify every missing or expired symbol in one batched request and persist the results.
+
+        Ambiguous symbols are resolved to their US primary listing; symbols that still cannot be
+        resolved are cached as failures for `failure_ttl` seconds.
+        """
+        with self._lock:
+            stale = [symbol for symbol in symbols
+                     if symbol not in self._entries or not self._is_fresh(self._entries[symbol])]
+
+        if stale:
+            logger.info(f"Qualifying {len(stale)} contracts: {stale}")
+            contracts = [Stock(symbol, self.exchange, self.currency) for symbol in stale]
+            try:
+                ib.qualifyContracts(*contracts)
+            except Exception as e:
+                # Transient failure (e.g. lost connection), leave the symbols to the next attempt
+                logger.error(f"Error qualifying contracts: {e}")
+                return self._cached(symbols)
+
+            resolved = {}
+            for symbol, contract in zip(stale, contracts):
+                # qualifyContracts fills conId in place; unknown or ambiguous symbols keep 0
+                if not contract.conId:
+                    contract = self._resolve_ambiguous(ib, symbol)
+                resolved[symbol] = contract
+
+            now = time.time()
+            with self._lock:
+                for symbol, contract in resolved.items():
+                    if contract is False:
+                        continue
+                    if contract is None:
+                        # Remember the failure briefly so each request does not retry it
+                        logger.warning(f"Could not qualify contract for {symbol}")
+                        self._entries[symbol] = {'failed': True, 'qualified_at': now}
+                        continue
+                    entry = {field: getattr(contract, field) for field in CONTRACT_FIELDS}
+                    entry['exchange'] = self.exchange
+                    entry['qualified_at'] = now
+                    self._entries[symbol] = entry
+                self.save()
+
+        return self._cached(symbols)
+
+    def _resolve_ambiguous(self, ib: IB, symbol: str):
+        """Pick the US primary listing among all matches for a symbol.
+
+        Returns the contract, None if no suitable match exists, or False if the request failed.
+        """
+        try:
+            details = ib.reqContractDetails(Stock(symbol, self.exchange, self.currency))
+        except Exception as e:
+            logger.error(f"Error requesting contract details for {symbol}: {e}")
+            return False
+
+        candidates = [d.contract for d in details if d.contract and d.contract.conId]
+        for exchange in US_PRIMARY_EXCHANGES:
+            for contract in candidates:
+                if contract.primaryExchange == exchange:
+                    logger.info(f"Resolved ambiguous {symbol} to its {exchange} listing (conId {contract.conId})")
+                    return contract
+        if len(candidates) == 1:
+            return candidates[0]
+        return None
+
+    def _cached(self, symbols: List[str]) -> Dict[str, Contract]:
+        """Cached contracts for the symbols that have one"""
+        qualified = {}
+        for symbol in symbols:
+            contract = self.get(symbol)
+            if contract is not None:
+                qualified[symbol] = contract
+        return qualified
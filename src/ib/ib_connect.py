@@ -10,7 +10,10 @@ from typing import Optional, List  # Add List for type hinting
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils import load_companies, find_file
+from utils import load_companies, find_file, load_db_config
+from db.database import StockDatabase
+from db.journal import IngestJournal, JournalFlusher
+from ib.contract_cache import ContractCache
 
 # 确保log目录存在 (修改为与src同级目录)
 log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'log')
@@ -39,13 +42,15 @@ if not logger.handlers:
 class IBServer:
     """IB connection and data acquisition management class"""
     
-    def __init__(self, host='127.0.0.1', port=4001, client_id=741):
+    def __init__(self, host='127.0.0.1', port=4001, client_id=741, journal: Optional[IngestJournal] = None):
         self.host = host
         self.port = port
         self.client_id = client_id
         self.ib = IB()
         self.connected = False
         self.save_dir = os.path.join(os.getcwd(), "data")
+        self.journal = journal  # Fetched bars are journaled here before reaching the database
+        self.contracts = ContractCache()
         
     def connect(self) -> bool:
         """Connect to IB Gateway/TWS"""
@@ -54,6 +59,10 @@ class IBServer:
             self.ib.connect(self.host, self.port, clientId=self.client_id)
             logger.info("Connecting IB successfully!")
             self.connected = True
+            
+            # Resolve all configured symbols up front in one batched request
+            qualified = self.contracts.qualify(self.ib, load_companies())
+            logger.info(f"{len(qualified)} contracts qualified and cached")
             return True
         except Exception as e:
             logger.error(f"Fail to connect to IB: {e}")
@@ -72,6 +81,16 @@ class IBServer:
         except Exception as e:
             logger.error(f"Fail to disconnect to IB: {e}")
     
+    def get_contract(self, company: str) -> Contract:
+        """Get the qualified contract for a company, qualifying and caching it if needed"""
+        contract = self.contracts.get(company)
+        if contract is None and self.connected:
+            contract = self.contracts.qualify(self.ib, [company]).get(company)
+        if contract is None:
+            logger.warning(f"Using unqualified contract for {company}")
+            contract = Stock(company, 'SMART', 'USD')
+        return contract
+    
     def get_data(
         self, 
         company: str,
@@ -88,7 +107,7 @@ class IBServer:
             
         try:
             logger.info(f"Requesting {company} historical data...")
-            contract = Stock(company, 'SMART', 'USD')
+            contract = self.get_contract(company)
             
             bars = self.ib.reqHistoricalData(
                 contract,
@@ -106,6 +125,8 @@ class IBServer:
                 
                 if is_save:
                     self.save_data(df, company, duration, bar_size)
+                if self.journal:
+                    self.journal.append(company, df.to_dict('records'))
                 return df
             else:
                 logger.warning(f"Failed to retrieve historical data for {company}")
@@ -156,8 +177,9 @@ def main(args=None):
     companies = load_companies()
     logger.info(f"Companies to fetch data for: {companies}")
     
-    # 初始化IB服务器
-    ib_server = IBServer()
+    # 初始化IB服务器, 获取的数据先写入本地日志再导入数据库
+    journal = IngestJournal()
+    ib_server = IBServer(journal=journal)
     
     # 尝试连接IB
     try:
@@ -188,6 +210,26 @@ def main(args=None):
     finally:
         # 断开连接
         ib_server.disconnect()
+    
+    # 尝试将日志中的数据导入数据库, 数据库不可用时保留在日志中等待下次导入
+    flush_journal(journal)
+
+
+def flush_journal(journal: Optional[IngestJournal] = None, requeue_rejected: bool = False) -> Optional[int]:
+    """Replay journaled bars into the database once, optionally retrying rejected segments first"""
+    journal = journal or IngestJournal()
+    if requeue_rejected:
+        journal.requeue_rejected()
+    db = StockDatabase(**load_db_config())
+    try:
+        flushed = JournalFlusher(journal, db).flush_once()
+        if flushed is None:
+            logger.warning(f"Database unavailable, {len(journal.pending_segments())} journal segments kept for later")
+        else:
+            logger.info(f"Flushed {flushed} journaled records into the database")
+        return flushed
+    finally:
+        db.disconnect()
 
 
 if __name__ == "__main__":
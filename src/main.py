@@ -17,8 +17,10 @@ if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
 from db.api import main as api_main
-from db.init_db import main as init_db_main
-from ib.ib_connect import main as ib_connect_main
+from db.init_db import main as init_db_main, scan_main as quality_scan_main
+from ib.ib_connect import main as ib_connect_main, flush_journal
+from ai.analyzer import main as analyze_main, parse_args as analyze_parse_args
+from strategy.backtest import main as backtest_main, parse_args as backtest_parse_args
 
 def setup_logging():
     """Setup logging configuration"""
@@ -37,8 +39,10 @@ def main():
     parser = argparse.ArgumentParser(description='AIFin Stock Data Analysis System')
     parser.add_argument(
         'command', 
-        choices=['api', 'init-db', 'ib-connect'],
-        help='Command to execute: api(start API service), init-db(initialize database), ib-connect(connect to IB to get data)'
+        choices=['api', 'init-db', 'ib-connect', 'quality-scan', 'flush-journal', 'analyze', 'backtest'],
+        help='Command to execute: api(start API service), init-db(initialize database), ib-connect(connect to IB to get data), '
+             'quality-scan(check stored data for gaps and bad bars), flush-journal(import journaled bars into database), '
+             'analyze(generate AI trading strategies), backtest(evaluate strategy parameter grids)'
     )
     
     # Parse known args to get the command first
@@ -48,6 +52,18 @@ def main():
         api_main()
     elif args.command == 'init-db':
         init_db_main()
+    elif args.command == 'quality-scan':
+        quality_scan_main()
+    elif args.command == 'flush-journal':
+        journal_parser = argparse.ArgumentParser(description='Flush Journal - Import journaled bars into database')
+        journal_parser.add_argument('--requeue-rejected', action='store_true',
+                                    help='Move segments from journal/rejected/ back before importing')
+        journal_args = journal_parser.parse_args(remaining_argv)
+        flush_journal(requeue_rejected=journal_args.requeue_rejected)
+    elif args.command == 'analyze':
+        analyze_main(analyze_parse_args(remaining_argv))
+    elif args.command == 'backtest':
+        backtest_main(backtest_parse_args(remaining_argv))
     elif args.command == 'ib-connect':
         # For ib-connect, we need to parse the remaining arguments
         ib_parser = argparse.ArgumentParser(description='IB Connect - Get historical stock data from Interactive Brokers')
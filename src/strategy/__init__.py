@@ -0,0 +1,4 @@
+"""
+策略模块包
+包含交易策略回测的所有功能
+"""
\ No newline at end of file
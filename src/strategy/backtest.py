@@ -0,0 +1,300 @@
+import os
+import sys
+import argparse
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Dict, Optional, Any, Callable
+
+import numpy as np
+import pandas as pd
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import load_companies, find_file, load_db_config
+from db.database import StockDatabase
+from db.quality import split_by_company
+
+# 确保log目录存在 (修改为与src同级目录)
+log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'log')
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# 为backtest模块创建独立的日志配置
+logger = logging.getLogger('strategy.backtest')
+
+# 只有在logger没有处理器时才添加处理器，避免重复
+if not logger.handlers:
+    logger.setLevel(logging.INFO)
+
+    # 创建文件处理器
+    file_handler = logging.FileHandler(os.path.join(log_dir, 'backtest.log'), encoding='utf-8')
+    file_handler.setLevel(logging.INFO)
+
+    # 创建日志格式
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+
+    # 添加处理器到logger
+    logger.addHandler(file_handler)
+
+TRADING_DAYS = 252
+
+# Per-bar columns loaded for every symbol and shared with the worker processes
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean via cumulative sums; NaN until the first full window"""
+    result = np.full(len(values), np.nan)
+    if window <= len(values):
+        cumsum = np.cumsum(np.insert(values, 0, 0.0))
+        result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def sma_crossover(bars: Dict[str, np.ndarray], fast: int, slow: int) -> np.ndarray:
+    """Long while the fast moving average is above the slow one, flat otherwise"""
+    close = bars['close']
+    if fast >= slow:
+        return np.zeros(len(close))
+    with np.errstate(invalid='ignore'):
+        return (_rolling_mean(close, fast) > _rolling_mean(close, slow)).astype(float)
+
+
+def momentum(bars: Dict[str, np.ndarray], lookback: int) -> np.ndarray:
+    """Long while the close is above the close `lookback` bars ago, flat otherwise"""
+    close = bars['close']
+    position = np.zeros(len(close))
+    position[lookback:] = close[lookback:] > close[:-lookback]
+    return position
+
+
+def mean_reversion(bars: Dict[str, np.ndarray], window: int, entry: float) -> np.ndarray:
+    """Long while the close is more than `entry` standard deviations below its moving average"""
+    close = bars['close']
+    mean = _rolling_mean(close, window)
+    variance = _rolling_mean(close ** 2, window) - mean ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = (close - mean) / np.sqrt(np.maximum(variance, 0.0))
+        return (zscore < -entry).astype(float)
+
+
+STRATEGIES: Dict[str, Callable[..., np.ndarray]] = {
+    'sma_crossover': sma_crossover,
+    'momentum': momentum,
+    'mean_reversion': mean_reversion
+}
+
+DEFAULT_GRIDS: Dict[str, Dict[str, List[Any]]] = {
+    'sma_crossover': {'fast': [5, 10, 20, 50], 'slow': [20, 50, 100, 200]},
+    'momentum': {'lookback': [5, 10, 20, 60, 120]},
+    'mean_reversion': {'window': [10, 20, 50], 'entry': [1.0, 1.5, 2.0, 2.5]}
+}
+
+# Parameter combinations that are meaningless for a strategy and skipped in sweeps
+PARAMETER_CONSTRAINTS: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    'sma_crossover': lambda params: params['fast'] < params['slow']
+}
+
+
+def evaluate(close: np.ndarray, position: np.ndarray, cost: float = 0.0005) -> Dict[str, float]:
+    """Performance of holding `position` (decided at each close) over the next bar, net of costs"""
+    if len(close) < 2:
+        return {'total_return': 0.0, 'annual_return': 0.0, 'sharpe': 0.0,
+                'max_drawdown': 0.0, 'trades': 0, 'exposure': 0.0}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bar_returns = np.nan_to_num(close[1:] / close[:-1] - 1.0)
+    held = position[:-1]
+    turnover = np.abs(np.diff(held, prepend=0.0))
+    strategy_returns = held * bar_returns - turnover * cost
+
+    equity = np.cumprod(1.0 + strategy_returns)
+    drawdown = equity / np.maximum.accumulate(equity) - 1.0
+    total_return = equity[-1] - 1.0
+    years = len(strategy_returns) / TRADING_DAYS
+    std = strategy_returns.std()
+
+    return {
+        'total_return': float(total_return),
+        'annual_return': float((1.0 + total_return) ** (1.0 / years) - 1.0) if total_return > -1 else -1.0,
+        'sharpe': float(strategy_returns.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else 0.0,
+        'max_drawdown': float(drawdown.min()),
+        'trades': int(np.count_nonzero(turnover)),
+        'exposure': float(held.mean())
+    }
+
+
+def _drop_missing_closes(bars: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Keep only bars with a close price, across all columns"""
+    valid = ~np.isnan(bars['close'])
+    return {field: bars[field][valid] for field in FIELDS}
+
+
+def load_bars_from_database(db: StockDatabase,
+                            companies: Optional[List[str]] = None) -> Dict[str, Dict[str, np.ndarray]]:
+    """Load OHLCV arrays per company from stock_data in one query"""
+    return {
+        company: _drop_missing_closes(bars)
+        for company, bars in split_by_company(db.get_ohlcv(companies)).items()
+    }
+
+
+def load_bars_from_csv(companies: List[str], data_dir: str, duration: str,
+                       bar_size: str) -> Dict[str, Dict[str, np.ndarray]]:
+    """Load OHLCV arrays per company from the CSV files saved by IBServer.save_data"""
+    bars = {}
+    for company in companies:
+        csv_path = find_file(directory=data_dir, duration=duration, bar_size=bar_size, company=company)
+        if csv_path:
+            df = pd.read_csv(csv_path, usecols=list(FIELDS))
+            bars[company] = _drop_missing_closes({field: df[field].to_numpy(dtype=float) for field in FIELDS})
+    return bars
+
+
+# Per-worker views onto the shared price buffer, set by _init_worker
+_shared_bars: Dict[str, Dict[str, np.ndarray]] = {}
+_shared_memory: Optional[shared_memory.SharedMemory] = None
+
+
+def _init_worker(shm_name: str, layout: List[tuple]):
+    """Attach to the parent's shared price buffer without copying it"""
+    global _shared_memory, _shared_bars
+    _shared_memory = shared_memory.SharedMemory(name=shm_name)
+    length = layout[-1][2] if layout else 0
+    buffer = np.ndarray((len(FIELDS), length), dtype=np.float64, buffer=_shared_memory.buf)
+    buffer.flags.writeable = False
+    _shared_bars = {
+        company: {field: buffer[i, start:end] for i, field in enumerate(FIELDS)}
+        for company, start, end in layout
+    }
+
+
+def _run_batch(strategy: str, param_sets: List[Dict[str, Any]], cost: float) -> List[Dict[str, Any]]:
+    """Evaluate a batch of parameter sets on every symbol"""
+    signal = STRATEGIES[strategy]
+    results = []
+    for params in param_sets:
+        for company, bars in _shared_bars.items():
+            metrics = evaluate(bars['close'], signal(bars, **params), cost)
+            results.append({'company': company, 'strategy': strategy, 'params': params, **metrics})
+    return results
+
+
+def parameter_grid(grid: Dict[str, List[Any]],
+                   constraint: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+    """Expand {name: [values]} into every combination of parameters that satisfies `constraint`"""
+    names = list(grid)
+    param_sets = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if constraint is not None:
+        param_sets = [params for params in param_sets if constraint(params)]
+    return param_sets
+
+
+def run_sweep(
+    bars: Dict[str, Dict[str, np.ndarray]],
+    strategy: str,
+    grid: Optional[Dict[str, List[Any]]] = None,
+    cost: float = 0.0005,
+    max_workers: Optional[int] = None,
+    batch_size: int = 4
+) -> List[Dict[str, Any]]:
+    """Evaluate a parameter grid over all symbols across a process pool.
+
+    OHLCV arrays are packed into one shared-memory buffer that workers map read-only, so each
+    worker only receives parameter sets, not price arrays.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy}, expected one of {list(STRATEGIES)}")
+    param_sets = parameter_grid(grid or DEFAULT_GRIDS[strategy], PARAMETER_CONSTRAINTS.get(strategy))
+
+    layout = []
+    offset = 0
+    for company, company_bars in bars.items():
+        length = len(company_bars['close'])
+        layout.append((company, offset, offset + length))
+        offset += length
+
+    # One (field, bar) matrix: every symbol's columns are contiguous slices of the same rows
+    size = max(len(FIELDS) * offset, 1) * np.dtype(np.float64).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        buffer = np.ndarray((len(FIELDS), offset), dtype=np.float64, buffer=shm.buf)
+        for company, start, end in layout:
+            for i, field in enumerate(FIELDS):
+                buffer[i, start:end] = bars[company][field]
+
+        batches = [param_sets[i:i + batch_size] for i in range(0, len(param_sets), batch_size)]
+        logger.info(f"Running {strategy} sweep: {len(param_sets)} parameter sets x {len(layout)} symbols")
+
+        results = []
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(shm.name, layout)) as executor:
+            futures = [executor.submit(_run_batch, strategy, batch, cost) for batch in batches]
+            for future in futures:
+                results.extend(future.result())
+    finally:
+        # The numpy view must be released before the mapping can be closed
+        buffer = None
+        shm.close()
+        shm.unlink()
+
+    results.sort(key=lambda r: r['sharpe'], reverse=True)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments for the backtest runner"""
+    parser = argparse.ArgumentParser(description='Backtest - Evaluate strategy parameter grids over stored stock data')
+    parser.add_argument('--strategy', type=str, default='sma_crossover', choices=list(STRATEGIES),
+                        help='Strategy to evaluate (default: sma_crossover)')
+    parser.add_argument('--source', type=str, default='db', choices=['db', 'csv'],
+                        help='Load prices from the database or the saved CSV files (default: db)')
+    parser.add_argument('--duration', type=str, default="4",
+                        help='Duration value of the saved CSV data (default: 4) month')
+    parser.add_argument('--bar-size', type=str, default="1",
+                        help='Bar size value of the saved CSV data (default: 1) day')
+    parser.add_argument('--cost', type=float, default=0.0005,
+                        help='Transaction cost per unit of turnover (default: 0.0005)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--top', type=int, default=20,
+                        help='Number of best results to log (default: 20)')
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    """Run a parameter sweep for one strategy over all configured companies"""
+    if args is None:
+        args = parse_args()
+
+    companies = load_companies()
+    if args.source == 'csv':
+        data_dir = os.path.join(os.getcwd(), "data")
+        bars = load_bars_from_csv(companies, data_dir, f"{args.duration}M", f"{args.bar_size}day")
+    else:
+        db = StockDatabase(**load_db_config())
+        if not db.connect():
+            logger.error("Failed to connect to database")
+            sys.exit(1)
+        try:
+            bars = load_bars_from_database(db, companies)
+        finally:
+            db.disconnect()
+
+    logger.info(f"Loaded prices for {len(bars)}/{len(companies)} companies")
+    results = run_sweep(bars, args.strategy, cost=args.cost, max_workers=args.workers)
+
+    for result in results[:args.top]:
+        logger.info(
+            f"{result['company']} {result['params']}: total return {result['total_return']:.2%}, "
+            f"sharpe {result['sharpe']:.2f}, max drawdown {result['max_drawdown']:.2%}, trades {result['trades']}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,17 @@ def load_companies():
 
 COMPANY = os.getenv("COMPANY", "BABA")
 
+# Database configuration - Use environment variables
+def load_db_config() -> Dict[str, Any]:
+    """Load database connection settings from environment variables"""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 3306)),
+        'database': os.getenv('DB_NAME', 'stock_db'),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD', '')  # Get password from environment variable
+    }
+
 logger = logging.getLogger(__name__)
 
 def _parse_value(value):
@@ -40,12 +51,14 @@ def _parse_value(value):
 def find_file(
     directory: str = "./Data", 
     duration: str = "4M", 
-    bar_size :str = "1day"
+    bar_size :str = "1day",
+    company: Optional[str] = None
     ) -> Optional[str]:
     """Find CSV file for the specified stock"""
+    company = company or COMPANY
     try:
         possible_csv_files = [
-            f"{COMPANY}_{duration}_{bar_size}.csv",
+            f"{company}_{duration}_{bar_size}.csv",
         ]
         
         for csv_filename in possible_csv_files:
@@ -54,7 +67,7 @@ def find_file(
                 logger.info(f"Found existing data file: {csv_path}")
                 return csv_path
         
-        logger.warning(f"Cannot find existing file for {COMPANY}.")
+        logger.warning(f"Cannot find existing file for {company}.")
         return None
     except Exception as e:
         logger.error(f"Error finding existing file: {e}")
@@ -0,0 +1,122 @@
+"""StrategyAnalyzer against a local mock /v1/chat/completions server"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from ai.analyzer import StrategyAnalyzer, ResponseCache
+
+COMPANIES = ['AAPL', 'MSFT', 'NVDA', 'TSLA']
+USAGE_TOKENS = 100
+
+
+class MockCompletionServer(ThreadingHTTPServer):
+    """Counts requests and the peak number handled at the same time"""
+
+    def __init__(self, delay: float = 0.3):
+        super().__init__(('127.0.0.1', 0), MockCompletionHandler)
+        self.delay = delay
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+
+class MockCompletionHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+
+        payload = json.dumps({
+            'id': 'chatcmpl-mock',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body['model'],
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': 'Mock strategy'},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': USAGE_TOKENS - 10, 'completion_tokens': 10, 'total_tokens': USAGE_TOKENS}
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = MockCompletionServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('OPENAI_BASE_URL', f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_analyzer(tmp_path, **kwargs) -> StrategyAnalyzer:
+    return StrategyAnalyzer(model='gpt-4o-mini', requests_per_minute=6000,
+                            cache=ResponseCache(str(tmp_path / 'llm')), **kwargs)
+
+
+def make_inputs(version: int = 1):
+    return {company: json.dumps([{'date': '2024-01-02', 'close': 100 + version}]) for company in COMPANIES}
+
+
+def test_requests_run_concurrently(server, tmp_path):
+    results = make_analyzer(tmp_path, max_workers=4).run(make_inputs())
+
+    assert all(result['status'] == 'success' for result in results.values())
+    assert server.requests == len(COMPANIES)
+    assert server.max_active > 1
+
+
+def test_unchanged_bars_are_answered_from_cache(server, tmp_path):
+    make_analyzer(tmp_path).run(make_inputs())
+    results = make_analyzer(tmp_path).run(make_inputs())
+
+    assert server.requests == len(COMPANIES)
+    assert all(result['cached'] for result in results.values())
+
+    # Changed bars miss the cache
+    make_analyzer(tmp_path).run(make_inputs(version=2))
+    assert server.requests == 2 * len(COMPANIES)
+
+
+def test_waits_for_in_flight_requests_before_skipping(server, tmp_path):
+    # Only two worst-case reservations fit at once; the rest wait for unused tokens to come back
+    analyzer = make_analyzer(tmp_path, max_workers=4, max_tokens=1000, token_budget=2500)
+    results = analyzer.run(make_inputs())
+
+    assert all(result['status'] == 'success' for result in results.values())
+    assert server.max_active <= 2
+    assert analyzer.budget.remaining == 2500 - len(COMPANIES) * USAGE_TOKENS
+
+
+def test_skips_when_budget_is_exhausted(server, tmp_path):
+    analyzer = make_analyzer(tmp_path, max_workers=4, max_tokens=1000, token_budget=500)
+    results = analyzer.run(make_inputs())
+
+    assert all(result['status'] == 'skipped' for result in results.values())
+    assert server.requests == 0